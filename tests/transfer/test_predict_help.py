@@ -3,7 +3,7 @@ import pytest
 import requests_mock
 
 from transfer.predict_help import (
-    convert_dict_to_actions,
+    convert_dict_to_actions, convert_html_to_text,
     parse_item_page_amz, parse_results_amz,
     parse_item_page_ebay, parse_results_ebay,
     parse_item_page_ws, parse_results_ws,
@@ -382,6 +382,26 @@ def test_parse_results_ws(**kwargs):
     }]
     assert output == expected
 
+def test_convert_html_to_text():
+    # Expected observations were produced by the html.parser walk the transfer models were trained on
+    expected_file = open("tests/transfer/mocks/mock_convert_html_to_text", "r")
+    expected = json.load(expected_file)
+    expected_file.close()
+
+    for mock_name, expected_obs in expected.items():
+        mock_file = open(f"tests/transfer/mocks/{mock_name}", "rb")
+        mock_body = mock_file.read().decode("utf-8")
+        mock_file.close()
+
+        assert convert_html_to_text(mock_body, simple=True) == expected_obs['simple']
+        output = convert_html_to_text(
+            mock_body,
+            simple=False,
+            clicked_options={'red', 'small'},
+            visited_asins={'B09P87V3LZ'}
+        )
+        assert output == expected_obs['rich']
+
 def test_convert_dict_to_actions():
     # Test RESULTS page type
     asin = "334490012932"
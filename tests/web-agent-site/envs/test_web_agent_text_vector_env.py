@@ -0,0 +1,89 @@
+import pytest
+import random
+import web_agent_site.envs.web_agent_text_env as text_env
+from web_agent_site.envs.web_agent_text_vector_env import WebAgentTextVectorEnv
+
+PRODUCTS = [{
+    'asin': f'B0000000{i:02d}',
+    'Title': f'Product {i}',
+    'Price': f'${i}.0',
+    'Rating': 'N.A.',
+    'MainImage': f'https://images/{i}.jpg',
+    'Description': f'Description {i}',
+    'BulletPoints': [f'Bullet {i}'],
+    'Reviews': [],
+    'Attributes': ['attr'],
+    'options': {'color': ['red', 'blue'], 'size': ['small', 'large']},
+    'option_to_image': {},
+    'category': 'category',
+    'query': 'query',
+    'product_category': 'a › b',
+} for i in range(12)]
+
+@pytest.fixture
+def vector_env(monkeypatch):
+    # Stub out product data, search, and goal scoring so the server builds in-memory
+    monkeypatch.setattr(text_env, 'load_products', lambda filepath, num_products=None, human_goals=True: (
+        PRODUCTS,
+        {p['asin']: p for p in PRODUCTS},
+        {p['asin']: 10.0 for p in PRODUCTS},
+        None,
+    ))
+    monkeypatch.setattr(text_env, 'init_search_engine', lambda num_products=None: None)
+    monkeypatch.setattr(text_env, 'get_top_n_product_from_keywords', lambda keywords, *args: PRODUCTS)
+    monkeypatch.setattr(text_env, 'get_goals', lambda products, prices, human_goals=True: [{
+        'instruction_text': f'Find product {i}',
+        'weight': 1,
+        'asin': p['asin'],
+        'attributes': ['attr'],
+        'query': 'query',
+    } for i, p in enumerate(products)])
+    monkeypatch.setattr(text_env, 'get_reward', lambda *args, **kwargs: (1.0, {}))
+    env = WebAgentTextVectorEnv(2, observation_mode='text', human_goals=1)
+    yield env
+    env.close()
+
+def test_reset(vector_env):
+    observations = vector_env.reset(sessions=[3, 7])
+    goals = vector_env.server.goals
+    assert len(observations) == 2
+    assert goals[3]['instruction_text'] in observations[0]
+    assert goals[7]['instruction_text'] in observations[1]
+    assert [env.session for env in vector_env.envs] == ['0_3', '1_7']
+
+def test_reset_seeded(vector_env):
+    assignments = []
+    for _ in range(3):
+        vector_env.server.user_sessions.clear()
+        random.seed(0)
+        vector_env.reset()
+        assignments.append([env.instruction_text for env in vector_env.envs])
+    assert assignments[0] == assignments[1] == assignments[2]
+
+def test_step(vector_env):
+    vector_env.reset(sessions=[0, 1])
+    observations, rewards, dones, infos = vector_env.step(['search[shoes]', 'click[bogus]'])
+    assert 'Page 1 (Total results: 12)' in observations[0]
+    assert 'Search' in observations[1] and 'Page 1' not in observations[1]
+    assert rewards == [0.0, 0.0]
+    assert dones == [False, False]
+    assert len(infos) == 2
+
+    available_actions = vector_env.get_available_actions()
+    assert available_actions[0]['has_search_bar'] is False
+    assert 'b000000000' in available_actions[0]['clickables']
+    assert available_actions[1]['has_search_bar'] is True
+
+    observations, rewards, dones, _ = vector_env.step(['click[b000000000]', 'search[hats]'])
+    assert 'Buy Now' in observations[0]
+    assert 'Page 1 (Total results: 12)' in observations[1]
+
+def test_batch_size_mismatch(vector_env):
+    with pytest.raises(ValueError):
+        vector_env.step(['search[shoes]'])
+    with pytest.raises(ValueError):
+        vector_env.step([])
+    with pytest.raises(ValueError):
+        vector_env.reset(sessions=[0, 1, 2])
+    with pytest.raises(ValueError):
+        WebAgentTextVectorEnv(0)
@@ -46,4 +46,25 @@ def test_generate_mturk_code():
     for session_id, expected in suite:
         output = generate_mturk_code(session_id)
         assert type(expected) is str
-        assert output == expected
\ No newline at end of file
+        assert output == expected
+
+def test_visible_texts():
+    html = (
+        '<html><head><title>Title</title><style>p {}</style></head>\n'
+        '<body>\n  <div>a &amp; b<!-- note -->c<script>x = 1</script>d</div>\n'
+        '  <pre>  </pre><span> </span>\n</body></html>'
+    )
+    output = list(visible_texts(html))
+    expected = ['\n', '\n', 'a & b', 'c', 'd', '\n', '  ', ' ', '\n']
+    assert output == expected
+
+
+def test_extract_instruction_text():
+    html = (
+        '<div id="instruction-text" class="text-center">\n'
+        '  <h4>Instruction: <br>find <b>red</b> shoes &amp; socks</h4>\n</div>'
+    )
+    assert extract_instruction_text(html) == 'Instruction: find red shoes & socks'
+    # Markup the regex does not cover falls back to parsing the instruction block
+    html = "<div id='instruction-text'><h4>Instruction: find &lt;hats&gt;</h4></div>"
+    assert extract_instruction_text(html) == 'Instruction: find <hats>'
@@ -1,6 +1,7 @@
 from bs4 import BeautifulSoup
 from bs4.element import Comment
 from enum import Enum
+from http.cookiejar import DefaultCookiePolicy
 import re, time
 from urllib.parse import urlencode
 
@@ -18,10 +19,17 @@ class Page(Enum):
 HEADER_ = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/101.0.4951.64 Safari/537.36'
 DEBUG_HTML = "temp.html"
 NUM_PROD_LIMIT = 10
+PRICE_PATTERN = re.compile(r'\d*\.?\d+')
 
 WEBSHOP_URL = "http://3.83.245.205:3000"
 WEBSHOP_SESSION = "abc"
 
+# Reuse connections to eBay, Amazon and the WebShop server across page fetches. Like the
+# one-off `requests.get` calls it replaces, it neither stores nor sends cookies
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.headers.update({'User-Agent': HEADER_, 'Accept-Language': 'en-US, en;q=0.5'})
+HTTP_SESSION.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
 
 def parse_results_ebay(query, page_num=None, verbose=True):
     query_string = '+'.join(query.split())
@@ -29,8 +37,8 @@ def parse_results_ebay(query, page_num=None, verbose=True):
     url = f'https://www.ebay.com/sch/i.html?_nkw={query_string}&_pgn={page_num}'
     if verbose:
         print(f"Search Results URL: {url}")
-    webpage = requests.get(url, headers={'User-Agent': HEADER_, 'Accept-Language': 'en-US, en;q=0.5'})
-    soup = BeautifulSoup(webpage.text, 'html.parser')
+    webpage = HTTP_SESSION.get(url)
+    soup = BeautifulSoup(webpage.content, 'lxml')
     products = soup.select('.s-item__wrapper.clearfix')
 
     results = []
@@ -68,11 +76,11 @@ def parse_item_page_ebay(asin, verbose=True):
     if verbose:
         print(f"Item Page URL: {url}")
     begin = time.time()
-    webpage = requests.get(url, headers={'User-Agent': HEADER_, 'Accept-Language': 'en-US, en;q=0.5'})
+    webpage = HTTP_SESSION.get(url)
     end = time.time()
     if verbose:
         print(f"Item page scraping took {end-begin} seconds")
-    soup = BeautifulSoup(webpage.content, "html.parser")
+    soup = BeautifulSoup(webpage.content, 'lxml')
 
     # Title
     try:
@@ -83,7 +91,7 @@ def parse_item_page_ebay(asin, verbose=True):
     # Price: Get price string, extract decimal numbers from string
     try:
         price_str = soup.find('div', {'class': 'mainPrice'}).text
-        prices = re.findall('\d*\.?\d+', price_str)
+        prices = PRICE_PATTERN.findall(price_str)
         product_dict["Price"] = prices[0]
     except:
         product_dict["Price"] = "N/A"
@@ -125,8 +133,8 @@ def parse_item_page_ebay(asin, verbose=True):
     try:
         # Ebay descriptions are shown in `iframe`s
         desc_link = soup.find('iframe', {'id': 'desc_ifr'})["src"]
-        desc_webpage = requests.get(desc_link, headers={'User-Agent': HEADER_, 'Accept-Language': 'en-US, en;q=0.5'})
-        desc_soup = BeautifulSoup(desc_webpage.content, "html.parser")
+        desc_webpage = HTTP_SESSION.get(desc_link)
+        desc_soup = BeautifulSoup(desc_webpage.content, 'lxml')
         desc = ' '.join(desc_soup.text.split())
     except:
         desc = "N/A"
@@ -152,8 +160,8 @@ def parse_results_ws(query, page_num=None, verbose=True):
     )
     if verbose:
         print(f"Search Results URL: {url}")
-    webpage = requests.get(url, headers={'User-Agent': HEADER_, 'Accept-Language': 'en-US, en;q=0.5'})
-    soup = BeautifulSoup(webpage.content, 'html.parser')
+    webpage = HTTP_SESSION.get(url)
+    soup = BeautifulSoup(webpage.content, 'lxml')
     products = soup.findAll('div', {'class': 'list-group-item'})
 
     results = []
@@ -197,8 +205,8 @@ def parse_item_page_ws(asin, query, page_num, options, verbose=True):
     )
     if verbose:
         print(f"Item Page URL: {url}")
-    webpage = requests.get(url, headers={'User-Agent': HEADER_, 'Accept-Language': 'en-US, en;q=0.5'})
-    soup = BeautifulSoup(webpage.content, 'html.parser')
+    webpage = HTTP_SESSION.get(url)
+    soup = BeautifulSoup(webpage.content, 'lxml')
 
     # Title, Price, Rating, and MainImage
     product_dict["Title"] = soup.find('h2').text
@@ -239,8 +247,8 @@ def parse_item_page_ws(asin, query, page_num, options, verbose=True):
     )
     if verbose:
         print(f"Item Description URL: {url}")
-    webpage = requests.get(url, headers={'User-Agent': HEADER_, 'Accept-Language': 'en-US, en;q=0.5'})
-    soup = BeautifulSoup(webpage.content, 'html.parser')
+    webpage = HTTP_SESSION.get(url)
+    soup = BeautifulSoup(webpage.content, 'lxml')
     product_dict["Description"] = soup.find(name="p", attrs={'class': 'product-info'}).text.strip()
 
     # Features
@@ -250,8 +258,8 @@ def parse_item_page_ws(asin, query, page_num, options, verbose=True):
     )
     if verbose:
         print(f"Item Features URL: {url}")
-    webpage = requests.get(url, headers={'User-Agent': HEADER_, 'Accept-Language': 'en-US, en;q=0.5'})
-    soup = BeautifulSoup(webpage.content, 'html.parser')
+    webpage = HTTP_SESSION.get(url)
+    soup = BeautifulSoup(webpage.content, 'lxml')
     bullets = soup.find(name="ul").findAll(name="li")
     product_dict["BulletPoints"] = '\n'.join([b.text.strip() for b in bullets])
 
@@ -265,8 +273,8 @@ def parse_results_amz(query, page_num=None, verbose=True):
         url += "&page=" + str(page_num)
     if verbose:
         print(f"Search Results URL: {url}")
-    webpage = requests.get(url, headers={'User-Agent': HEADER_, 'Accept-Language': 'en-US, en;q=0.5'})
-    soup = BeautifulSoup(webpage.content, 'html.parser')
+    webpage = HTTP_SESSION.get(url)
+    soup = BeautifulSoup(webpage.content, 'lxml')
     products = soup.findAll('div', {'data-component-type': 's-search-result'})
     if products is None:
         temp = open(DEBUG_HTML, "w")
@@ -301,11 +309,11 @@ def parse_item_page_amz(asin, verbose=True):
     if verbose:
         print("Item Page URL:", url)
     begin = time.time()
-    webpage = requests.get(url, headers={'User-Agent': HEADER_, 'Accept-Language': 'en-US, en;q=0.5'})
+    webpage = HTTP_SESSION.get(url)
     end = time.time()
     if verbose:
         print(f"Item page scraping took {end-begin} seconds")
-    soup = BeautifulSoup(webpage.content, "html.parser")
+    soup = BeautifulSoup(webpage.content, 'lxml')
 
     # Title
     try:
@@ -397,6 +405,8 @@ def convert_html_to_text(html, simple=False, clicked_options=None, visited_asins
         return (
             element.parent.name not in ignore and not isinstance(element, Comment)
         )
+    # Kept on html.parser: the transfer models were trained on its text, and lxml
+    # places whitespace and XML declarations differently on scraped pages
     html_obj = BeautifulSoup(html, 'html.parser')
     texts = html_obj.findAll(text=True)
     visible_texts = filter(tag_visible, texts)
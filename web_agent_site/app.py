@@ -270,6 +270,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="WebShop flask app backend configuration")
     parser.add_argument("--log", action='store_true', help="Log actions on WebShop in trajectory file")
     parser.add_argument("--attrs", action='store_true', help="Show attributes tab in item page")
+    parser.add_argument("--port", type=int, default=3000, help="Port to serve WebShop on")
 
     args = parser.parse_args()
     if args.log:
@@ -277,4 +278,4 @@ if __name__ == "__main__":
         user_log_dir.mkdir(parents=True, exist_ok=True)
     SHOW_ATTRS_TAB = args.attrs
 
-    app.run(host='0.0.0.0', port=3000)
+    app.run(host='0.0.0.0', port=args.port)
@@ -7,11 +7,12 @@ import random
 from collections import defaultdict
 from ast import literal_eval
 from decimal import Decimal
+from functools import lru_cache
 
 import cleantext
 from tqdm import tqdm
 from rank_bm25 import BM25Okapi
-from flask import render_template_string
+from flask import current_app
 from rich import print
 from pyserini.search.lucene import LuceneSearcher
 
@@ -34,6 +35,9 @@ NEXT_PAGE = 'Next >'
 PREV_PAGE = '< Prev'
 BACK_TO_SEARCH = 'Back to Search'
 
+ACTION_PATTERN = re.compile(r'(.+)\[(.+)\]')
+NON_PRICE_PATTERN = re.compile(r'[^\d.]')
+
 ACTION_TO_TEMPLATE = {
     'Description': 'description_page.html',
     'Features': 'features_page.html',
@@ -45,15 +49,15 @@ def map_action_to_html(action, **kwargs):
     action_name, action_arg = parse_action(action)
     if action_name == 'start':
         path = os.path.join(TEMPLATE_DIR, 'search_page.html')
-        html = render_template_string(
-            read_html_template(path=path),
+        html = render_html_template(
+            path,
             session_id=kwargs['session_id'],
             instruction_text=kwargs['instruction_text'],
         )
     elif action_name == 'search':
         path = os.path.join(TEMPLATE_DIR, 'results_page.html')
-        html = render_template_string(
-            read_html_template(path=path),
+        html = render_html_template(
+            path,
             session_id=kwargs['session_id'],
             products=kwargs['products'],
             keywords=kwargs['keywords'],
@@ -63,8 +67,8 @@ def map_action_to_html(action, **kwargs):
         )
     elif action_name == 'click' and action_arg == END_BUTTON:
         path = os.path.join(TEMPLATE_DIR, 'done_page.html')
-        html = render_template_string(
-            read_html_template(path),
+        html = render_html_template(
+            path,
             session_id=kwargs['session_id'],
             reward=kwargs['reward'],
             asin=kwargs['asin'],
@@ -80,8 +84,8 @@ def map_action_to_html(action, **kwargs):
         )
     elif action_name == 'click' and action_arg in ACTION_TO_TEMPLATE:
         path = os.path.join(TEMPLATE_DIR, ACTION_TO_TEMPLATE[action_arg])
-        html = render_template_string(
-            read_html_template(path),
+        html = render_html_template(
+            path,
             session_id=kwargs['session_id'],
             product_info=kwargs['product_info'],
             keywords=kwargs['keywords'],
@@ -92,8 +96,8 @@ def map_action_to_html(action, **kwargs):
         )
     elif action_name == 'click':
         path = os.path.join(TEMPLATE_DIR, 'item_page.html')
-        html = render_template_string(
-            read_html_template(path),
+        html = render_html_template(
+            path,
             session_id=kwargs['session_id'],
             product_info=kwargs['product_info'],
             keywords=kwargs['keywords'],
@@ -114,12 +118,30 @@ def read_html_template(path):
     return template
 
 
+@lru_cache(maxsize=None)
+def compile_html_template(jinja_env, path):
+    """Read and compile a template once per Jinja environment"""
+    return jinja_env.from_string(read_html_template(path))
+
+
+def render_html_template(path, **context):
+    """
+    Render the template at `path` with the current Flask app's template context.
+    Compiled templates are cached unless the app reloads templates (debug mode).
+    """
+    if current_app.jinja_env.auto_reload:
+        template = current_app.jinja_env.from_string(read_html_template(path))
+    else:
+        template = compile_html_template(current_app.jinja_env, path)
+    current_app.update_template_context(context)
+    return template.render(context)
+
+
 def parse_action(action):
     """
     Parse action string to action name and its arguments.
     """
-    pattern = re.compile(r'(.+)\[(.+)\]')
-    m = re.match(pattern, action)
+    m = ACTION_PATTERN.match(action)
     if m is None:
         action_name = action
         action_arg = None
@@ -167,8 +189,7 @@ def get_top_n_product_from_keywords(
     else:
         keywords = ' '.join(keywords)
         hits = search_engine.search(keywords, k=SEARCH_RETURN_N)
-        docs = [search_engine.doc(hit.docid) for hit in hits]
-        top_n_asins = [json.loads(doc.raw())['id'] for doc in docs]
+        top_n_asins = (json.loads(search_engine.doc(hit.docid).raw())['id'] for hit in hits)
         top_n_products = [product_item_dict[asin] for asin in top_n_asins if asin in product_item_dict]
     return top_n_products
 
@@ -291,7 +312,7 @@ def load_products(filepath, num_products=None, human_goals=True):
             price_tag = '$100.0'
         else:
             pricing = [
-                float(Decimal(re.sub(r'[^\d.]', '', price)))
+                float(Decimal(NON_PRICE_PATTERN.sub('', price)))
                 for price in pricing.split('$')[1:]
             ]
             if len(pricing) == 1:
@@ -87,7 +87,7 @@ def normalize_color_size(product_prices: dict) -> Tuple[dict, dict]:
     for s in all_sizes:
         matched = False
         for pattern in SIZE_PATTERNS:
-            m = re.search(pattern, s)
+            m = pattern.search(s)
             if m is not None:
                 matched = True
                 size_mapping[s] = pattern.pattern
@@ -2,6 +2,7 @@ from gym.envs.registration import register
 
 from web_agent_site.envs.web_agent_site_env import WebAgentSiteEnv
 from web_agent_site.envs.web_agent_text_env import WebAgentTextEnv
+from web_agent_site.envs.web_agent_text_vector_env import WebAgentTextVectorEnv
 
 register(
   id='WebAgentSiteEnv-v0',
@@ -1,19 +1,49 @@
 import gym
 import random
+import re
 import requests
 import string
 import time
 
-from bs4 import BeautifulSoup
-from bs4.element import Comment
+from bs4 import BeautifulSoup, SoupStrainer
 from gym import spaces
 from os.path import join, dirname, abspath
+from requests.adapters import HTTPAdapter
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.common.exceptions import ElementNotInteractableException
 from web_agent_site.engine.engine import parse_action, END_BUTTON
+from web_agent_site.utils import extract_instruction_text, visible_texts
+
+# Server-rendered markup of the reward block, matched without building a DOM
+REWARD_PATTERN = re.compile(r'id="reward"[^>]*>[^<]*<pre[^>]*>([^<]*)</pre>')
+
+# Reads clickable texts and option values in one WebDriver round-trip
+CLICKABLE_TEXTS_SCRIPT = (
+    "return [arguments[0].map(e => e.innerText.trim()), arguments[1].map(e => e.value)];"
+)
+
+# Chrome flags for unrendered sessions; the agent reads markup, not pixels
+HEADLESS_CHROME_ARGUMENTS = (
+    '--blink-settings=imagesEnabled=false',
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--disable-sync',
+    '--no-first-run',
+    '--disable-default-apps',
+)
+BLOCKED_URLS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf',
+]
+
+# Keep-alive connections reused by every `_parse_html(url=...)` request
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.mount('http://', HTTPAdapter(pool_connections=8, pool_maxsize=32))
+HTTP_SESSION.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=32))
 
 class WebAgentSiteEnv(gym.Env):
     """Gym environment for HTML mode of WebShop environment"""
@@ -29,17 +59,36 @@ class WebAgentSiteEnv(gym.Env):
             Recommended value: 2.0s
         render (`bool`) -- Show browser if set to `True`.
         session ('str') -- Session ID to initialize environment with
+        debugger_address ('str') -- `host:port` of a running Chrome started with
+            `--remote-debugging-port`. If set, the environment attaches to that
+            browser and works in its own tab, so many environments can share
+            one Chrome process.
+        base_url ('str') -- Address of the WebShop server to browse
+            (default 'http://127.0.0.1:3000'). Point environments at different
+            servers to run several of them side by side in one process.
         """
         super(WebAgentSiteEnv, self).__init__()
         self.observation_mode = observation_mode
         self.kwargs = kwargs
+        self.base_url = kwargs.get('base_url', 'http://127.0.0.1:3000')
 
         # Create a browser driver to simulate the WebShop site
         service = Service(join(dirname(abspath(__file__)), 'chromedriver'))
         options = Options()
-        if 'render' not in kwargs or not kwargs['render']:
+        if kwargs.get('debugger_address') is not None:
+            options.add_experimental_option('debuggerAddress', kwargs['debugger_address'])
+        elif 'render' not in kwargs or not kwargs['render']:
             options.add_argument("--headless")  # don't show browser
+            for argument in HEADLESS_CHROME_ARGUMENTS:
+                options.add_argument(argument)
         self.browser = webdriver.Chrome(service=service, options=options)
+        if kwargs.get('debugger_address') is not None:
+            # Open a tab of our own in the shared browser; `close` closes only this tab
+            self.browser.switch_to.new_window('tab')
+        if 'render' not in kwargs or not kwargs['render']:
+            # Nobody looks at the page, so don't download images or fonts (CSS is kept for layout)
+            self.browser.execute_cdp_cmd('Network.enable', {})
+            self.browser.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URLS})
 
         # Set flags and values for WebShop session
         self.text_to_clickable = None
@@ -100,17 +149,19 @@ class WebAgentSiteEnv(gym.Env):
         else:
             has_search_bar = True
 
-        # Collect buttons, links, and options as clickables
-        buttons = self.browser.find_elements_by_class_name('btn')
-        product_links = self.browser.find_elements_by_class_name('product-link')
-        buying_options = self.browser.find_elements_by_css_selector("input[type='radio']")
+        # Collect buttons, links, and options as clickables (buttons precede
+        # product links in document order on every page)
+        clickables = self.browser.find_elements(By.CSS_SELECTOR, '.btn, .product-link')
+        buying_options = self.browser.find_elements(By.CSS_SELECTOR, "input[type='radio']")
 
+        texts, opt_values = self.browser.execute_script(
+            CLICKABLE_TEXTS_SCRIPT, clickables, buying_options
+        )
         self.text_to_clickable = {
-            f'{b.text}': b
-            for b in buttons + product_links
+            f'{text}': b
+            for text, b in zip(texts, clickables)
         }
-        for opt in buying_options:
-            opt_value = opt.get_attribute('value')
+        for opt, opt_value in zip(buying_options, opt_values):
             self.text_to_clickable[f'{opt_value}'] = opt
         return dict(
             has_search_bar=has_search_bar,
@@ -127,30 +178,35 @@ class WebAgentSiteEnv(gym.Env):
         """
         if html is None:
             if url is not None:
-                html = requests.get(url)
+                html = HTTP_SESSION.get(url).content
             else:
-                html = self.state['html']
-        html_obj = BeautifulSoup(html, 'html.parser')
+                html = self.browser.page_source
+        html_obj = BeautifulSoup(html, 'lxml')
         return html_obj
 
     def get_reward(self):
         """Get reward value at current step of the environment"""
-        html_obj = self._parse_html()
+        html = self.browser.page_source
+        # Locate the reward block once and match the regex from there, rather than
+        # scanning the page with the regex and again with a substring test
+        start = html.find('id="reward"')
+        if start == -1:
+            return 0.0
+        m = REWARD_PATTERN.match(html, start)
+        if m is not None:
+            return float(m.group(1))
+        html_obj = BeautifulSoup(html, 'lxml', parse_only=SoupStrainer(id='reward'))
         r = html_obj.find(id='reward')
         r = float(r.findChildren("pre")[0].string) if r is not None else 0.0
         return r
     
     def get_instruction_text(self):
         """Get corresponding instruction text for environment current step"""
-        html_obj = self._parse_html(self.browser.page_source)
-        instruction_text = html_obj.find(id='instruction-text').h4.text
-        return instruction_text
+        return extract_instruction_text(self.browser.page_source)
     
     def convert_html_to_text(self, html):
         """Strip HTML of tags and add separators to convert observation into simple mode"""
-        texts = self._parse_html(html).findAll(text=True)
-        visible_texts = filter(tag_visible, texts)
-        observation = ' [SEP] '.join(t.strip() for t in visible_texts if t != '\n')
+        observation = ' [SEP] '.join(t.strip() for t in visible_texts(html) if t != '\n')
         return observation
     
     @property
@@ -168,7 +224,7 @@ class WebAgentSiteEnv(gym.Env):
     @property
     def observation(self):
         """Compiles state into either the `html` or `text` observation mode"""
-        html = self.state['html']
+        html = self.browser.page_source
         if self.observation_mode == 'html':
             return html
         elif self.observation_mode == 'text':
@@ -193,7 +249,7 @@ class WebAgentSiteEnv(gym.Env):
             self.session = self.assigned_session
         else:
             self.session = ''.join(random.choices(string.ascii_lowercase, k=5))
-        init_url = f'http://127.0.0.1:3000/{self.session}'
+        init_url = f'{self.base_url}/{self.session}'
         self.browser.get(init_url)
 
         self.instruction_text = self.get_instruction_text()
@@ -208,10 +264,3 @@ class WebAgentSiteEnv(gym.Env):
         # TODO: When DB used instead of JSONs, tear down DB here
         self.browser.close()
         print('Browser closed.')
-
-def tag_visible(element):
-    """Helper method to strip HTML block of extraneous tags"""
-    ignore = {'style', 'script', 'head', 'title', 'meta', '[document]'}
-    return (
-        element.parent.name not in ignore and not isinstance(element, Comment)
-    )
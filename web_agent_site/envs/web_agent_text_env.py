@@ -1,14 +1,18 @@
 import gym
 import json
 import random
+import re
 import string
+import threading
 import time
 import torch
 
-from bs4 import BeautifulSoup
-from bs4.element import Comment
 from collections import defaultdict
 from flask import Flask
+from functools import lru_cache
+from flask.testing import EnvironBuilder
+from html import unescape
+from lxml import etree
 from web_agent_site.engine.engine import (
     load_products,
     init_search_engine,
@@ -24,10 +28,30 @@ from web_agent_site.utils import (
     DEFAULT_FILE_PATH,
     FEAT_CONV,
     FEAT_IDS,
-    random_idx
+    extract_instruction_text,
+    random_idx,
+    visible_text_nodes,
+    visible_texts,
 )
 
 app = Flask(__name__)
+
+# Server-rendered markup of the product image, matched without building a DOM
+PRODUCT_IMAGE_PATTERN = re.compile(r'<img id="product-image" src="([^"]*)"')
+
+# Search bar, buttons, product links, and buying options, in document order
+CLICKABLE_XPATH = etree.XPath(
+    '//input[@type="radio" or @id="search_input"]'
+    ' | //*[contains(concat(" ", normalize-space(@class), " "), " btn ")]'
+    ' | //*[contains(concat(" ", normalize-space(@class), " "), " product-link ")]'
+)
+
+# URL fragments identifying each page, checked in order by `SimServer.get_page_name`
+PAGE_NAMES = ('search_results', 'item_page', 'item_sub_page', 'done')
+
+# Lower-cased clickable names of item sub pages mapped to their canonical names
+SUB_PAGE_NAMES = {k.lower(): k for k in ACTION_TO_TEMPLATE}
+
 class WebAgentTextEnv(gym.Env):
     """Gym environment for Text mode of WebShop environment"""
     def __init__(
@@ -72,13 +96,16 @@ class WebAgentTextEnv(gym.Env):
         self.session = self.kwargs.get('session')
         self.session_prefix = self.kwargs.get('session_prefix')
         if self.kwargs.get('get_image', 0):
-            self.feats = torch.load(FEAT_CONV)
-            self.ids = torch.load(FEAT_IDS)
-            self.ids = {url: idx for idx, url in enumerate(self.ids)}
+            self.feats, self.ids = load_image_features()
         self.prev_obs = []
         self.prev_actions = []
         self.num_prev_obs = self.kwargs.get('num_prev_obs', 0)
         self.num_prev_actions = self.kwargs.get('num_prev_actions', 0)
+
+        # Parsed DOM, clickables, and instruction of the most recent page, reused until the page changes
+        self._html_cache = (None, None)
+        self._actions_cache = (None, None)
+        self._instruction_cache = (None, None)
         self.reset()
 
     def step(self, action):
@@ -92,12 +119,14 @@ class WebAgentTextEnv(gym.Env):
         If action not valid, perform nothing.
         """
         info = None
-        self.get_available_actions()
 
         # Determine action type (click, search) and argument
         action_name, action_arg = parse_action(action)
         if action_arg is not None:
             action_arg = action_arg.lower()
+        if action_name == 'click':
+            # Clickables are only needed to validate and perform a click
+            self.get_available_actions()
         if (action_name == 'search' and 
             action_arg is not None and 
             action_arg != ''):
@@ -124,22 +153,35 @@ class WebAgentTextEnv(gym.Env):
 
     def get_available_actions(self):
         """Returns list of available actions at the current step"""
-        html_obj = self._parse_html()
-
-        # Collect search bar, buttons, links, and options as clickables
-        search_bar = html_obj.find(id='search_input')
-        has_search_bar = True if search_bar is not None else False
-        buttons = html_obj.find_all(class_='btn')
-        product_links  = html_obj.find_all(class_='product-link')
-        buying_options = html_obj.select('input[type="radio"]')
+        html = self.browser.page_source
+        if html == self._actions_cache[0]:
+            has_search_bar, self.text_to_clickable = self._actions_cache[1]
+            return dict(
+                has_search_bar=has_search_bar,
+                clickables=list(self.text_to_clickable.keys()),
+            )
+        html_obj = self._parse_html(html)
+
+        # Collect search bar, buttons, links, and options as clickables in a
+        # single pass (buttons precede product links in document order)
+        has_search_bar = False
+        clickables, buying_options = [], []
+        for tag in CLICKABLE_XPATH(html_obj):
+            if tag.get('id') == 'search_input':
+                has_search_bar = True
+            elif tag.tag == 'input' and tag.get('type') == 'radio':
+                buying_options.append(tag)
+            else:
+                clickables.append(tag)
 
         self.text_to_clickable = {
-            f'{b.get_text()}'.lower(): b
-            for b in buttons + product_links
+            f'{b.xpath("string()")}'.lower(): b
+            for b in clickables
         }
         for opt in buying_options:
             opt_value = opt.get('value')
             self.text_to_clickable[f'{opt_value}'] = opt
+        self._actions_cache = (html, (has_search_bar, self.text_to_clickable))
         return dict(
             has_search_bar=has_search_bar,
             clickables=list(self.text_to_clickable.keys()),
@@ -147,10 +189,15 @@ class WebAgentTextEnv(gym.Env):
     
     def get_image(self):
         """Scrape image from page HTML and return as a list of pixel values"""
-        html_obj = self._parse_html(self.browser.page_source)
-        image_url = html_obj.find(id='product-image')
+        html = self.browser.page_source
+        m = PRODUCT_IMAGE_PATTERN.search(html)
+        if m is not None:
+            image_url = unescape(m.group(1))
+        elif 'id="product-image"' in html:
+            image_url = self._parse_html(html).find('.//*[@id="product-image"]').get('src')
+        else:
+            image_url = None
         if image_url is not None:
-            image_url = image_url['src']
             if image_url in self.ids:
                 image_idx = self.ids[image_url]
                 image = self.feats[image_idx]
@@ -159,27 +206,31 @@ class WebAgentTextEnv(gym.Env):
 
     def get_instruction_text(self):
         """Get corresponding instruction text for current environment session"""
-        html_obj = self._parse_html(self.browser.page_source)
-        instruction_text = html_obj.find(id='instruction-text').h4.text
+        html = self.browser.page_source
+        if html == self._instruction_cache[0]:
+            return self._instruction_cache[1]
+        instruction_text = extract_instruction_text(html)
+        self._instruction_cache = (html, instruction_text)
         return instruction_text
 
     def _parse_html(self, html=None):
         """
-        Returns web request result wrapped in BeautifulSoup object
+        Returns web request result parsed into an lxml tree
 
         Arguments:
         url (`str`): If no url or html is provided, use the current
             observation (HTML) for parsing.
         """
         if html is None:
-            html = self.state['html']
-        html_obj = BeautifulSoup(html, 'html.parser')
-        return html_obj
+            html = self.browser.page_source
+        if html != self._html_cache[0]:
+            self._html_cache = (html, etree.HTML(html))
+        return self._html_cache[1]
     
     @property
     def observation(self):
         """Compiles state into either the `html` or `text` observation mode"""
-        html = self.state['html']
+        html = self.browser.page_source
         if self.observation_mode == 'html':
             return html
         elif self.observation_mode == 'text':
@@ -187,7 +238,7 @@ class WebAgentTextEnv(gym.Env):
         elif self.observation_mode == 'text_rich':
             return self.convert_html_to_text(html, simple=False)
         elif self.observation_mode == 'url':
-            return self.state['url']
+            return self.browser.current_url
         else:
             raise ValueError(
                 f'Observation mode {self.observation_mode} not supported.'
@@ -207,25 +258,23 @@ class WebAgentTextEnv(gym.Env):
     
     def convert_html_to_text(self, html, simple=False):
         """Strip HTML of tags and add separators to convert observation into simple mode"""
-        texts = self._parse_html(html).findAll(text=True)
-        visible_texts = filter(tag_visible, texts)
         if simple:
             # For `simple` mode, return just [SEP] separators
-            return ' [SEP] '.join(t.strip() for t in visible_texts if t != '\n')
+            return ' [SEP] '.join(t.strip() for t in visible_texts(html) if t != '\n')
         else:
             # Otherwise, return an observation with tags mapped to specific, unique separators
             observation = ''
-            for t in visible_texts:
+            for t, parent in visible_text_nodes(self._parse_html(html)):
                 if t == '\n': continue
-                if t.parent.name == 'button':  # button
+                if parent.tag == 'button':  # button
                     processed_t = f'[button] {t} [button_]'
-                elif t.parent.name == 'label':  # options
-                    if f'"{t}"' in self.state['url']:
+                elif parent.tag == 'label':  # options
+                    if f'"{t}"' in self.browser.current_url:
                         processed_t = f'  [clicked button] {t} [clicked button_]'
                         observation = f'You have clicked {t}.\n' + observation
                     else:
                         processed_t = f'  [button] {t} [button_]'
-                elif t.parent.get('class') == ["product-link"]: # product asins
+                elif parent.get('class', '').split() == ["product-link"]: # product asins
                     if f'{t}' in self.server.user_sessions[self.session]['asins']:
                         processed_t = f'\n[clicked button] {t} [clicked button_]'
                     else:
@@ -264,10 +313,23 @@ class WebAgentTextEnv(gym.Env):
         pass
     
 
-def tag_visible(element):
-    ignore = {'style', 'script', 'head', 'title', 'meta', '[document]'}
-    return (
-        element.parent.name not in ignore and not isinstance(element, Comment)
+@lru_cache(maxsize=None)
+def load_image_features():
+    """Loads product image features and their URL index once, shared by every environment"""
+    feats = torch.load(FEAT_CONV)
+    ids = {url: idx for idx, url in enumerate(torch.load(FEAT_IDS))}
+    return feats, ids
+
+
+@lru_cache(maxsize=4096)
+def render_search_page(session_id, instruction_text):
+    """Render the search page, which depends only on its arguments, so
+    resets and "back to search" clicks on a known session skip rendering
+    """
+    return map_action_to_html(
+        'start',
+        session_id=session_id,
+        instruction_text=instruction_text,
     )
 
 
@@ -335,15 +397,19 @@ class SimServer:
         self.render_time = 0
         self.sample_time = 0
         self.assigned_instruction_text = None  # TODO: very hacky, should remove
+
+        # Build the WSGI environ once; each `receive` pushes a request context from a copy
+        self._environ = EnvironBuilder(app).get_environ()
+
+        # Environments sharing this server may call `receive` from several threads (see
+        # `WebAgentTextVectorEnv`); one action is handled at a time so session state, the
+        # timing counters, and the search engine are never used concurrently
+        self._lock = threading.Lock()
         
     @app.route('/', methods=['GET', 'POST'])
     def index(self, session_id, **kwargs):
         """Redirect to the search page with the given session ID"""
-        html = map_action_to_html(
-            'start',
-            session_id=session_id,
-            instruction_text=kwargs['instruction_text'],
-        )
+        html = render_search_page(session_id, kwargs['instruction_text'])
         url = f'{self.base_url}/{session_id}'
         return html, url
     
@@ -402,13 +468,12 @@ class SimServer:
         clickable = text_to_clickable[clickable_name]
 
         # Update session logs with information of last product asin selected
-        if (clickable.get('class') is not None and
-            clickable.get('class')[0] == 'product-link'):
+        if clickable.get('class', '').split()[:1] == ['product-link']:
             session["asin"] = clickable_name.upper()
             session["actions"]["asin"] += 1
             session["asins"].add(session["asin"])
         elif clickable.get('name') is not None:
-            clickable_key = clickable['name'].lower()
+            clickable_key = clickable.get('name').lower()
             session["options"][clickable_key] = clickable_name
             session["actions"]["options"] += 1
 
@@ -441,10 +506,7 @@ class SimServer:
         """Render and return the HTML for a product's sub page (i.e. description, features)"""
         session = self.user_sessions[session_id]
         clickable_name = kwargs['clickable_name']
-        for k in ACTION_TO_TEMPLATE:
-            if clickable_name.lower() == k.lower():
-                clickable_name = k
-                break
+        clickable_name = SUB_PAGE_NAMES.get(clickable_name.lower(), clickable_name)
         
         # Set fields + url of page, then render page's HTML
         product_info = self.product_item_dict[session["asin"]]
@@ -505,100 +567,100 @@ class SimServer:
     
     def receive(self, session_id, current_url, session_int=None, **kwargs):
         """Map action to the corresponding page"""
+        # Push one request context per action; the recursive page handlers below run inside it
+        with self._lock, app.request_context(self._environ.copy()):
+            return self._receive(session_id, current_url, session_int=session_int, **kwargs)
+
+    def _receive(self, session_id, current_url, session_int=None, **kwargs):
+        """Map action to the corresponding page, within an active request context"""
         status = dict(reward=0.0, done=False)
 
-        with app.app_context(), app.test_request_context():
-            # Create/determine goal, instruction_text from current session
-            if session_id not in self.user_sessions:
-                idx = session_int if (session_int is not None and isinstance(session_int, int)) else random_idx(self.cum_weights) 
-                goal = self.goals[idx]
-                instruction_text = goal['instruction_text']
-                self.user_sessions[session_id] = {'goal': goal, 'done': False}
-            else:
-                instruction_text = \
-                    self.user_sessions[session_id]['goal']['instruction_text']
-            if self.assigned_instruction_text is not None:
-                instruction_text = self.assigned_instruction_text  # TODO: very hacky, should remove
-                self.user_sessions[session_id]['goal']['instruction_text'] = instruction_text
-            session = self.user_sessions[session_id]
-
-            if not kwargs:
-                # If no action, reset the session variables
-                kwargs['instruction_text'] = instruction_text
-                html, url = self.index(session_id, **kwargs)
-                self.user_sessions[session_id].update(
-                    {
-                        'keywords': None,
-                        'page': None,
-                        'asin': None,
-                        'asins': set(),
-                        'options': dict(),
-                        'actions': defaultdict(int)
-                    }
+        # Create/determine goal, instruction_text from current session
+        if session_id not in self.user_sessions:
+            idx = session_int if (session_int is not None and isinstance(session_int, int)) else random_idx(self.cum_weights) 
+            goal = self.goals[idx]
+            instruction_text = goal['instruction_text']
+            self.user_sessions[session_id] = {'goal': goal, 'done': False}
+        else:
+            instruction_text = \
+                self.user_sessions[session_id]['goal']['instruction_text']
+        if self.assigned_instruction_text is not None:
+            instruction_text = self.assigned_instruction_text  # TODO: very hacky, should remove
+            self.user_sessions[session_id]['goal']['instruction_text'] = instruction_text
+        session = self.user_sessions[session_id]
+
+        if not kwargs:
+            # If no action, reset the session variables
+            kwargs['instruction_text'] = instruction_text
+            html, url = self.index(session_id, **kwargs)
+            self.user_sessions[session_id].update(
+                {
+                    'keywords': None,
+                    'page': None,
+                    'asin': None,
+                    'asins': set(),
+                    'options': dict(),
+                    'actions': defaultdict(int)
+                }
+            )
+        elif 'keywords' in kwargs:
+            # If search keywords are available, run a search
+            html, url = self.search_results(session_id, **kwargs)
+        elif 'clickable_name' in kwargs:
+            clickable_name = kwargs['clickable_name'].lower()
+            page_name = self.get_page_name(current_url)
+            if clickable_name == END_BUTTON.lower():
+                # If "buy now" clicked, calculate reward and flag session as terminated
+                html, url, reward = self.done(session_id, **kwargs)
+                status['reward'] = reward
+                status['done'] = True
+            elif clickable_name == BACK_TO_SEARCH.lower():
+                # If "back to search" clicked, recursively reset the session back to search page
+                html, url, status = self._receive(session_id, current_url)
+            elif (clickable_name == NEXT_PAGE.lower() and 
+                  page_name == 'search_results'):
+                # If "next page" clicked from search results, re-render with `page` enumerated
+                html, url, status = self._receive(
+                    session_id,
+                    current_url,
+                    keywords=session["keywords"],
+                    page=session["page"] + 1,
                 )
-            elif 'keywords' in kwargs:
-                # If search keywords are available, run a search
-                html, url = self.search_results(session_id, **kwargs)
-            elif 'clickable_name' in kwargs:
-                clickable_name = kwargs['clickable_name'].lower()
-                if clickable_name == END_BUTTON.lower():
-                    # If "buy now" clicked, calculate reward and flag session as terminated
-                    html, url, reward = self.done(session_id, **kwargs)
-                    status['reward'] = reward
-                    status['done'] = True
-                elif clickable_name == BACK_TO_SEARCH.lower():
-                    # If "back to search" clicked, recursively reset the session back to search page
-                    html, url, status = self.receive(session_id, current_url)
-                elif (clickable_name == NEXT_PAGE.lower() and 
-                      self.get_page_name(current_url) == 'search_results'):
-                    # If "next page" clicked from search results, re-render with `page` enumerated
-                    html, url, status = self.receive(
-                        session_id,
-                        current_url,
-                        keywords=session["keywords"],
-                        page=session["page"] + 1,
-                    )
-                elif (clickable_name == PREV_PAGE.lower() and 
-                      self.get_page_name(current_url) == 'search_results'):
-                    # If "prev page" clicked from search results, re-render with `page` denumerated
-                    html, url, status = self.receive(
-                        session_id,
-                        current_url,
-                        keywords=session["keywords"],
-                        page=session["page"] - 1,
-                    )
-                elif (clickable_name == PREV_PAGE.lower() and 
-                      self.get_page_name(current_url) == 'item_sub_page'):
-                    # If "prev page" clicked from sub page, return to corresponding item page
-                    html, url = self.item_page(session_id, **kwargs)
-                elif (clickable_name == PREV_PAGE.lower() and 
-                      self.get_page_name(current_url) == 'item_page'):
-                    # If "prev page" clicked from item page, return to search results page
-                    html, url = self.search_results(
-                        session_id,
-                        keywords=session["keywords"],
-                        page=session["page"],
-                        **kwargs
-                    )
-                elif clickable_name in [k.lower() for k in ACTION_TO_TEMPLATE]:
-                    # Render item_sub_page if clickable is description, features, or reviews
-                    html, url = self.item_sub_page(session_id, **kwargs)
-                else:
-                    # Otherwise, render current item page
-                    html, url = self.item_page(session_id, **kwargs)
-            return html, url, status
+            elif (clickable_name == PREV_PAGE.lower() and 
+                  page_name == 'search_results'):
+                # If "prev page" clicked from search results, re-render with `page` denumerated
+                html, url, status = self._receive(
+                    session_id,
+                    current_url,
+                    keywords=session["keywords"],
+                    page=session["page"] - 1,
+                )
+            elif (clickable_name == PREV_PAGE.lower() and 
+                  page_name == 'item_sub_page'):
+                # If "prev page" clicked from sub page, return to corresponding item page
+                html, url = self.item_page(session_id, **kwargs)
+            elif (clickable_name == PREV_PAGE.lower() and 
+                  page_name == 'item_page'):
+                # If "prev page" clicked from item page, return to search results page
+                html, url = self.search_results(
+                    session_id,
+                    keywords=session["keywords"],
+                    page=session["page"],
+                    **kwargs
+                )
+            elif clickable_name in SUB_PAGE_NAMES:
+                # Render item_sub_page if clickable is description, features, or reviews
+                html, url = self.item_sub_page(session_id, **kwargs)
+            else:
+                # Otherwise, render current item page
+                html, url = self.item_page(session_id, **kwargs)
+        return html, url, status
     
     def get_page_name(self, url):
         """Determine which page (i.e. item_page, search_results) the given URL is pointing at"""
         if url is None:
             return None
-        page_names = [
-            'search_results',
-            'item_page',
-            'item_sub_page',
-            'done'
-        ]
-        for page_name in page_names:
+        for page_name in PAGE_NAMES:
             if page_name in url:
                 return page_name
         return ''  # index page
@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from web_agent_site.envs.web_agent_text_env import WebAgentTextEnv
+from web_agent_site.utils import DEFAULT_FILE_PATH, random_idx
+
+class WebAgentTextVectorEnv:
+    """
+    Batch of text environments sharing one `SimServer`, stepped concurrently. The server
+    handles one request at a time; parsing pages and building observations run in parallel
+    """
+    def __init__(
+            self,
+            num_envs,
+            observation_mode='html',
+            file_path=DEFAULT_FILE_PATH,
+            num_workers=None,
+            **kwargs
+        ):
+        """
+        Constructor for vectorized text environment
+
+        Arguments:
+        num_envs (`int`) -- Number of environments in the batch
+        observation_mode (`str`) -- ['html' | 'text' | 'text_rich' | 'url'] (default 'html')
+        num_workers (`int`) -- Threads used to step environments (default `num_envs`)
+        **kwargs -- Passed to every `WebAgentTextEnv`; products, goals, and the search
+            engine are loaded once and shared across the batch
+        """
+        if num_envs < 1:
+            raise ValueError(f'num_envs must be at least 1, got {num_envs}')
+        # Each env gets its own session prefix so sessions never collide on the shared server
+        session_prefix = kwargs.pop('session_prefix', None) or ''
+        self.server = kwargs.pop('server', None)
+        self.envs = []
+        for i in range(num_envs):
+            env = WebAgentTextEnv(
+                observation_mode=observation_mode,
+                file_path=file_path,
+                server=self.server,
+                session_prefix=f'{session_prefix}{i}_',
+                **kwargs
+            )
+            self.server = env.server
+            self.envs.append(env)
+        self.pool = ThreadPoolExecutor(max_workers=num_workers or num_envs)
+
+    @property
+    def num_envs(self):
+        return len(self.envs)
+
+    def step(self, actions):
+        """
+        Takes one action per environment and returns lists of (observation, reward, done, info)
+
+        Arguments:
+        actions (`list` of `str`): One action per environment, see `WebAgentTextEnv.step`
+        """
+        if len(actions) != self.num_envs:
+            raise ValueError(f'Expected {self.num_envs} actions, got {len(actions)}')
+        results = list(self.pool.map(lambda env, action: env.step(action), self.envs, actions))
+        observations, rewards, dones, infos = map(list, zip(*results))
+        return observations, rewards, dones, infos
+
+    def get_available_actions(self):
+        """Returns list of available actions at the current step for each environment"""
+        return [env.get_available_actions() for env in self.envs]
+
+    def reset(self, sessions=None):
+        """
+        Reset every environment and return the list of initial observations
+
+        Arguments:
+        sessions (`list`) -- Optional session (goal index or ID) per environment. If not
+            given, goals are sampled from the global `random` state
+        """
+        if sessions is None:
+            # Draw goals on the calling thread so seeded rollouts don't depend on thread scheduling
+            sessions = [random_idx(self.server.cum_weights) for _ in range(self.num_envs)]
+        elif len(sessions) != self.num_envs:
+            raise ValueError(f'Expected {self.num_envs} sessions, got {len(sessions)}')
+        results = list(self.pool.map(lambda env, session: env.reset(session=session), self.envs, sessions))
+        return [observation for observation, _ in results]
+
+    def close(self):
+        self.pool.shutdown()
+        for env in self.envs:
+            env.close()
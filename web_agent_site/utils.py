@@ -2,6 +2,10 @@ import bisect
 import hashlib
 import logging
 import random
+import re
+from bs4 import BeautifulSoup, SoupStrainer
+from html import unescape
+from lxml import etree
 from os.path import dirname, abspath, join
 
 BASE_DIR = dirname(abspath(__file__))
@@ -17,6 +21,14 @@ FEAT_IDS = join(BASE_DIR, '../data/feat_ids.pt')
 HUMAN_ATTR_PATH = join(BASE_DIR, '../data/items_human_ins.json')
 HUMAN_ATTR_PATH = join(BASE_DIR, '../data/items_human_ins.json')
 
+# Server-rendered markup of the instruction block, matched without building a DOM
+INSTRUCTION_TEXT_PATTERN = re.compile(r'id="instruction-text"[^>]*>\s*<h4[^>]*>(.*?)</h4>', re.S)
+TAG_PATTERN = re.compile(r'<[^>]*>')
+
+INVISIBLE_TAGS = frozenset({'style', 'script', 'head', 'title', 'meta'})
+PRESERVE_WHITESPACE_TAGS = frozenset({'pre', 'textarea'})
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
 def random_idx(cum_weights):
     """Generate random index by sampling uniformly from sum of all weights, then
     selecting the `min` between the position to keep the list sorted (via bisect)
@@ -45,4 +57,41 @@ def generate_mturk_code(session_id: str) -> str:
     worker once the session is completed
     """
     sha = hashlib.sha1(session_id.encode())
-    return sha.hexdigest()[:10].upper()
\ No newline at end of file
+    return sha.hexdigest()[:10].upper()
+
+def extract_instruction_text(html):
+    """Returns the instruction text of a WebShop page, parsing only the instruction
+    block if the markup does not match `INSTRUCTION_TEXT_PATTERN`
+    """
+    m = INSTRUCTION_TEXT_PATTERN.search(html)
+    if m is not None:
+        return unescape(TAG_PATTERN.sub('', m.group(1)))
+    html_obj = BeautifulSoup(html, 'lxml', parse_only=SoupStrainer(id='instruction-text'))
+    return html_obj.find(id='instruction-text').h4.text
+
+def visible_text_nodes(root):
+    """Yields `(text, parent)` for the visible text nodes of a page parsed with
+    `etree.HTML`, in document order, where `parent` is the lxml element containing
+    the text. Comments and text directly inside `INVISIBLE_TAGS` are skipped, and the
+    strings match the ones BeautifulSoup's `findAll(text=True)` returns
+    """
+    if root is None:
+        return
+    # `//text()` walks the tree once in C; comment contents are not text nodes
+    for text in root.xpath('//text()'):
+        parent = text.getparent()
+        if text.is_tail:
+            parent = parent.getparent()
+        if parent is None or parent.tag in INVISIBLE_TAGS:
+            continue
+        if not text.strip(ASCII_SPACES) and not any(
+            el.tag in PRESERVE_WHITESPACE_TAGS for el in (parent, *parent.iterancestors())
+        ):
+            # BeautifulSoup collapses whitespace-only strings outside <pre> and <textarea>
+            text = '\n' if '\n' in text else ' '
+        yield str(text), parent
+
+def visible_texts(html):
+    """Yields the visible text nodes of an HTML page in document order"""
+    for text, _ in visible_text_nodes(etree.HTML(html)):
+        yield text